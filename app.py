@@ -2,40 +2,62 @@
 # app.py – VERSÃO PARA PRODUÇÃO (RENDER) - COM BASE DE MATERIAIS
 # --------------------------------------------------------------
 
-# ⚠️ IMPORTANTE: Configurar matplotlib ANTES de importar pyplot
-import matplotlib
-matplotlib.use('Agg')  # Backend sem GUI para servidor
-
+import functools
+import io
+import math
 import os
-import uuid
-from datetime import datetime
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import numpy as np
+import orjson
+from numba import njit, vectorize
 from PIL import Image, ImageDraw, ImageFont
 from supabase import create_client
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-import matplotlib.pyplot as plt
-import shutil
+from flask_compress import Compress
+import matplotlib.style
+# API orientada a objetos com canvas Agg: sem pyplot e seu estado global
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Estilo dos gráficos aplicado uma vez (não a cada requisição)
+matplotlib.style.use('seaborn-v0_8-whitegrid')
 
 # Config
-load_dotenv()
+# .env só completa o ambiente: variáveis já definidas (ex.: Render) prevalecem
+load_dotenv(override=False)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET = os.getenv("SUPABASE_STORAGE_BUCKET", "dimensionamento")
-UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(STATIC_DIR, exist_ok=True)
 
-# Inicializa Supabase apenas se as credenciais estiverem disponíveis
-supabase_client = None
-if SUPABASE_URL and SUPABASE_KEY and SUPABASE_URL != "http://localhost:54321":
+@functools.lru_cache(maxsize=1)
+def get_supabase():
+    """
+    Cliente Supabase criado no primeiro uso e reutilizado depois
+    
+    Com gunicorn --preload o app é importado uma vez no master; o cliente
+    (e suas conexões HTTP) nasce já dentro de cada worker, sem ser
+    compartilhado pelo fork.
+    
+    Returns:
+        Client ou None se as credenciais não estiverem disponíveis
+    """
+    if not (SUPABASE_URL and SUPABASE_KEY and SUPABASE_URL != "http://localhost:54321"):
+        return None
     try:
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+        return create_client(SUPABASE_URL, SUPABASE_KEY)
     except Exception as e:
         print(f"⚠️ Aviso: Não foi possível conectar ao Supabase: {e}")
         print("→ Rodando em modo LOCAL (sem upload)")
+        return None
 
 # ============== BASE DE DADOS DE MATERIAIS ==============
 MATERIAIS_TUBULACAO = {
@@ -167,6 +189,12 @@ MATERIAIS_TUBULACAO = {
     }
 }
 
+# Códigos inteiros dos materiais e tabela de rugosidades (m) indexada por eles;
+# o último índice é o default (aço comercial, 0.045 mm)
+_MATERIAL_CODES = {material_id: i for i, material_id in enumerate(MATERIAIS_TUBULACAO)}
+_MATERIAL_DEFAULT = len(_MATERIAL_CODES)
+_RUGOSIDADE_M = np.array([dados["rugosidade_mm"] for dados in MATERIAIS_TUBULACAO.values()] + [0.045]) / 1000
+
 # ============== TABELA DE PRESSÃO DE VAPOR ==============
 PRESSAO_VAPOR_AGUA = {
     0: 611, 5: 872, 10: 1228, 15: 1705, 20: 2338,
@@ -176,39 +204,35 @@ PRESSAO_VAPOR_AGUA = {
     100: 101325
 }
 
+# Tabela em arrays para interpolação (np.interp já satura nos extremos)
+_TV = np.array(sorted(PRESSAO_VAPOR_AGUA), dtype=np.float64)
+_PV = np.array([PRESSAO_VAPOR_AGUA[t] for t in sorted(PRESSAO_VAPOR_AGUA)], dtype=np.float64)
+
 def get_pressao_vapor(temp):
     """Interpola pressão de vapor da água em Pa"""
-    if temp <= 0:
-        return 611
-    if temp >= 100:
-        return 101325
-    
-    temps = sorted(PRESSAO_VAPOR_AGUA.keys())
-    for i in range(len(temps)-1):
-        if temps[i] <= temp <= temps[i+1]:
-            t1, t2 = temps[i], temps[i+1]
-            p1, p2 = PRESSAO_VAPOR_AGUA[t1], PRESSAO_VAPOR_AGUA[t2]
-            return p1 + (p2-p1)*(temp-t1)/(t2-t1)
-    return 2338
+    return float(np.interp(temp, _TV, _PV))
 
 # ============== FUNÇÕES HIDRÁULICAS ==============
 def velocity(Q, D):
     """Calcula velocidade do fluido"""
     return Q / (np.pi * (D ** 2) / 4) if D > 0 else 0
 
-def reynolds(rho, v, D, mu):
-    """Calcula número de Reynolds"""
-    return rho * v * D / mu if mu > 0 else 0
+# Constantes de Sonnad-Goudar (logaritmo natural no lugar de log10)
+_SG_A = 2 / math.log(10)
+_SG_D = math.log(10) / 5.02
 
-def friction_factor(Re, D, material=None, rugosidade_mm=None):
+def _sonnad_goudar(Re, rug_rel):
     """
-    Calcula fator de atrito de Darcy-Weisbach
+    Fator de atrito de Darcy-Weisbach para um par (Re, rugosidade relativa)
+    
+    Colebrook-White resolvido pela forma explícita de Sonnad-Goudar (2006),
+    baseada na função de Lambert W: mesma precisão da iteração, sem laço.
+    Única implementação: compilada pelo Numba como função escalar (kernel da
+    curva) e como ufunc (arrays).
     
     Args:
-        Re: Número de Reynolds
-        D: Diâmetro interno (m)
-        material: ID do material da base de dados (ex: "pvc")
-        rugosidade_mm: Rugosidade customizada em mm (opcional)
+        Re: Número de Reynolds (laminar abaixo de 2000)
+        rug_rel: e/(3.7*D), pré-calculado por quem chama
     
     Returns:
         float: Fator de atrito f
@@ -217,104 +241,560 @@ def friction_factor(Re, D, material=None, rugosidade_mm=None):
     if Re < 2000:
         return 64 / max(Re, 1e-12)
     
-    # Determina rugosidade
-    if rugosidade_mm is not None:
-        # Rugosidade customizada fornecida
-        e = rugosidade_mm / 1000  # Converte mm para m
-    elif material and material in MATERIAIS_TUBULACAO:
-        # Usa base de dados
-        e = MATERIAIS_TUBULACAO[material]["rugosidade_mm"] / 1000
-    else:
-        # Default: aço comercial
-        e = 0.045 / 1000
-    
-    # Fórmula de Colebrook-White (aproximação de Swamee-Jain)
-    rugosidade_relativa = e / D
-    termo1 = rugosidade_relativa / 3.7
-    termo2 = 5.74 / (Re ** 0.9)
-    
-    return (-2 * np.log10(termo1 + termo2)) ** (-2)
+    d = _SG_D * Re
+    s = rug_rel * d + math.log(d)
+    q = s ** (s / (s + 1))
+    ln_dq = math.log(d / q)
+    g = rug_rel * d + ln_dq
+    z = math.log(q / g)
+    delta_la = z * g / (g + 1)
+    delta_cfa = delta_la * (1 + (z / 2) / ((g + 1) ** 2 + (z / 3) * (2 * g - 1)))
+    return 1 / (_SG_A * (ln_dq + delta_cfa)) ** 2
 
-def hf_distributed(L, D, v, f):
-    """Calcula perda de carga distribuída"""
-    return f * (L/D) * (v**2)/(2*9.81)
+_sonnad_goudar_nb = njit(cache=True, fastmath=True)(_sonnad_goudar)
+_sonnad_goudar_ufunc = vectorize(["float64(float64, float64)"], cache=True, fastmath=True)(_sonnad_goudar)
 
-def hf_local(K, v):
-    """Calcula perda de carga localizada"""
-    return K * (v**2)/(2*9.81)
+def friction_factor_vec(Re, D, e):
+    """
+    Calcula fator de atrito de Darcy-Weisbach (vetorizado, com broadcast)
+    
+    Args:
+        Re: Array de números de Reynolds
+        D: Array de diâmetros internos (m)
+        e: Array de rugosidades absolutas (m)
+    
+    Returns:
+        np.ndarray: Fatores de atrito f
+    """
+    return _sonnad_goudar_ufunc(Re, e / (3.7 * D))
 
 def npsha(Patm, Pvap, rho, g, P_suc, hs, hf_suc, v):
     """Calcula NPSH disponível"""
     return (P_suc/(rho*g) - Pvap/(rho*g) + hs - hf_suc - v**2/(2*g))
 
-def calculate_hmt_for_scenario(q_val, data, fluido, nivel_suc, nivel_rec, destino_idx=0):
-    """Calcula Hmt para um cenário específico de níveis"""
-    if q_val <= 0:
-        return 0
+def _trechos_arrays(trechos):
+    """
+    Extrai L, D, rugosidade (m) e conexões dos trechos em arrays NumPy
     
-    rho = float(fluido.get("densidade", 1000))
-    mu = float(fluido.get("viscosidade", 0.001))
-    suc = data.get("suc", {})
+    Raises:
+        ValueError: Trecho com valor não numérico ou geometria inválida
+            (D deve ser > 0, L e rugosidade >= 0, todos finitos)
+    """
+    try:
+        L = np.array([t.get("L", 0) for t in trechos], dtype=np.float64)
+        D = np.array([t.get("D", 0.1) for t in trechos], dtype=np.float64)
+        conn = np.array([int(t.get("conexoes", 0)) for t in trechos], dtype=np.float64)
+        rug_custom_mm = np.array([t.get("rugosidade_mm") for t in trechos], dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Trechos com valores não numéricos")
     
-    # Determina pressão de sucção
-    tipo_res_suc = suc.get("tipo_reservatorio", "aberto")
-    if tipo_res_suc == "pressurizado":
-        P_suc = 101325 + float(suc.get("pressao_manometrica", 0))
-    else:
-        P_suc = 101325
-    
-    # Calcula perdas na sucção
-    hf_suc_g, hl_suc_g = 0.0, 0.0
-    for t in suc.get("trechos", []):
-        L = float(t.get("L", 0))
-        D = float(t.get("D", 0.1))
-        mat = t.get("material")
-        rug_custom = t.get("rugosidade_mm")
-        conn = int(t.get("conexoes", 0))
-        v_g = velocity(q_val, D)
-        Re_g = reynolds(rho, v_g, D, mu)
-        f_g = friction_factor(Re_g, D, material=mat, rugosidade_mm=rug_custom)
-        hf_suc_g += hf_distributed(L, D, v_g, f_g)
-        hl_suc_g += hf_local(0.5*conn, v_g)
-    
-    # Recalque (pode ser múltiplo)
-    recalques = data.get("recalque", [])
-    if not isinstance(recalques, list):
-        recalques = [recalques]
-    
-    rec = recalques[destino_idx] if destino_idx < len(recalques) else recalques[0]
-    
-    # Determina pressão de recalque
-    tipo_res_rec = rec.get("tipo_reservatorio", "aberto")
-    if tipo_res_rec == "pressurizado":
-        P_rec = 101325 + float(rec.get("pressao_manometrica", 0))
+    # Rugosidade: tabela indexada pelo código do material, exceto se customizada
+    mat_idx = np.array([_MATERIAL_CODES.get(t.get("material"), _MATERIAL_DEFAULT) for t in trechos], dtype=np.intp)
+    e = np.where(np.isnan(rug_custom_mm), _RUGOSIDADE_M[mat_idx], rug_custom_mm / 1000)
+    
+    # Comparações com NaN/inf falham, então não finitos também são rejeitados
+    if not np.all(np.isfinite(D) & (D > 0)):
+        raise ValueError("Diâmetro dos trechos deve ser > 0")
+    if not np.all(np.isfinite(L) & (L >= 0)):
+        raise ValueError("Comprimento dos trechos deve ser >= 0")
+    if not np.all(np.isfinite(e) & (e >= 0)):
+        raise ValueError("Rugosidade dos trechos deve ser >= 0")
+    
+    return L, D, e, conn
+
+def _perdas_trechos(Q, L, D, e, conn, rho, mu):
+    """
+    Calcula perdas para uma vazão ou um array de vazões (broadcast vazões × trechos)
+    
+    Returns:
+        tuple: (hf somada, hl somada, velocidades por trecho)
+    """
+    Q = np.asarray(Q, dtype=np.float64)[..., None]
+    v = Q / (np.pi * D * D / 4)
+    Re = rho * v * D / mu if mu > 0 else np.zeros_like(v)
+    f = friction_factor_vec(Re, D, e)
+    
+    hf = (f * L / D * v * v / (2*9.81)).sum(axis=-1)
+    hl = (0.5 * conn * v * v / (2*9.81)).sum(axis=-1)
+    return hf, hl, v
+
+@njit(cache=True, fastmath=True)
+def system_curve(q_arr, L, D, e, conn, rho, mu, delta_P, out):
+    """
+    Curva do sistema sem o desnível geométrico (kernel compilado com Numba)
+    
+    Args:
+        q_arr: Array de vazões (m³/s)
+        L, D, e, conn: Arrays dos trechos (sucção e recalque concatenados)
+        rho, mu: Densidade e viscosidade do fluido
+        delta_P: Diferença de pressão entre reservatórios (m)
+        out: Array pré-alocado (mesmo tamanho de q_arr) que recebe o resultado
+    
+    Returns:
+        np.ndarray: out, preenchido com delta_P + perdas totais para cada vazão
+    """
+    # Invariantes por trecho calculados uma vez, fora do laço de vazões:
+    # o laço interno fica só com multiplicações (sem divisões)
+    n = L.size
+    v_por_q = np.empty(n)   # 1/A
+    re_por_q = np.empty(n)  # rho*D/(mu*A)
+    rug_rel = np.empty(n)   # e/(3.7*D)
+    l_d = np.empty(n)       # L/D
+    k_loc = np.empty(n)     # K das conexões
+    for j in range(n):
+        v_por_q[j] = 4 / (np.pi * D[j] * D[j])
+        re_por_q[j] = rho * D[j] * v_por_q[j] / mu if mu > 0 else 0.0
+        rug_rel[j] = e[j] / (3.7 * D[j])
+        l_d[j] = L[j] / D[j]
+        k_loc[j] = 0.5 * conn[j]
+    inv_2g = 1 / (2*9.81)
+    
+    for i in range(q_arr.size):
+        q = q_arr[i]
+        perdas = 0.0
+        for j in range(n):
+            v = q * v_por_q[j]
+            f = _sonnad_goudar_nb(q * re_por_q[j], rug_rel[j])
+            perdas += (f * l_d[j] + k_loc[j]) * v * v
+        out[i] = delta_P + perdas * inv_2g
+    return out
+
+# Compila o kernel na importação (com cache=True só a primeira vez paga o JIT)
+system_curve(np.array([0.01]), np.array([1.0]), np.array([0.1]), np.array([4.5e-5]),
+             np.array([0.0]), 1000.0, 0.001, 0.0, np.empty(1))
+
+def _perdas_destinos(arrays, Q, rho, mu):
+    """
+    Calcula as perdas de todos os recalques de uma vez
+    
+    Os trechos de cada destino (arrays de _trechos_arrays) são empilhados em
+    matrizes (N_destinos × M_max); o preenchimento tem L = 0 e conexões = 0,
+    então não contribui nas perdas.
+    
+    Returns:
+        tuple: arrays (hf, hl, velocidade máxima) com um valor por destino
+    """
+    m_max = max((L.size for L, _, _, _ in arrays), default=0)
+    
+    L2d = np.zeros((len(arrays), m_max))
+    D2d = np.ones((len(arrays), m_max))
+    e2d = np.zeros((len(arrays), m_max))
+    conn2d = np.zeros((len(arrays), m_max))
+    valid = np.zeros((len(arrays), m_max), dtype=bool)
+    for i, (L, D, e, conn) in enumerate(arrays):
+        n = L.size
+        L2d[i, :n], D2d[i, :n], e2d[i, :n], conn2d[i, :n] = L, D, e, conn
+        valid[i, :n] = True
+    
+    hf, hl, v = _perdas_trechos(Q, L2d, D2d, e2d, conn2d, rho, mu)
+    v_max = np.where(valid, v, 0).max(axis=-1, initial=0.0)
+    return hf, hl, v_max
+
+def _pressao_reservatorio(res, Patm):
+    """Pressão absoluta na superfície do reservatório (Pa)"""
+    if res.get("tipo_reservatorio", "aberto") == "pressurizado":
+        return Patm + float(res.get("pressao_manometrica", 0))
+    return Patm
+
+def _niveis_reservatorio(res, chave_legada):
+    """Níveis (nominal, mínimo, máximo); nominal aceita a chave antiga hs/hr"""
+    nominal = float(res.get("nivel_nominal", res.get(chave_legada, 0)))
+    return (nominal,
+            float(res.get("nivel_min", nominal)),
+            float(res.get("nivel_max", nominal)))
+
+def _hmt(delta_P, delta_h, hf_suc, hl_suc, hf_rec, hl_rec):
+    """Hmt = diferença de pressão + diferença geométrica + perdas"""
+    return delta_P + delta_h + hf_suc + hl_suc + hf_rec + hl_rec
+
+# ============== FONTES DO RELATÓRIO ==============
+@dataclass(frozen=True)
+class FontesRelatorio:
+    title: ImageFont.ImageFont
+    subtitle: ImageFont.ImageFont
+    header: ImageFont.ImageFont
+    text: ImageFont.ImageFont
+    small: ImageFont.ImageFont
+
+# Candidatos por estilo, em ordem de preferência (Windows -> Linux)
+_FONT_CANDIDATOS = {
+    "regular": ["arial.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"],
+    "bold": ["arialbd.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"],
+}
+
+def _probe_fonts():
+    """Retorna o primeiro arquivo de fonte utilizável de cada estilo (None se nenhum)"""
+    paths = {}
+    for estilo, candidatos in _FONT_CANDIDATOS.items():
+        paths[estilo] = None
+        for caminho in candidatos:
+            try:
+                ImageFont.truetype(caminho, 10)
+            except OSError:
+                continue
+            paths[estilo] = caminho
+            break
+    return paths
+
+FONT_PATHS = _probe_fonts()
+
+def _load_fonts():
+    """Carrega as fontes do PDF a partir de FONT_PATHS (fonte default se não houver)"""
+    def fonte(estilo, tamanho):
+        caminho = FONT_PATHS[estilo]
+        return ImageFont.truetype(caminho, tamanho) if caminho else ImageFont.load_default()
+    
+    return FontesRelatorio(
+        title=fonte("bold", 140),
+        subtitle=fonte("regular", 65),
+        header=fonte("bold", 70),
+        text=fonte("regular", 52),
+        small=fonte("regular", 46),
+    )
+
+# Carregadas uma vez na importação e reutilizadas em todas as requisições
+FONTS = _load_fonts()
+
+# ============== GRÁFICO DA CURVA DO SISTEMA ==============
+@dataclass(frozen=True)
+class GraficoSistema:
+    fig: Figure
+    canvas: FigureCanvasAgg
+    ax: object
+    faixa: object
+    pior: object
+    nominal: object
+    melhor: object
+    operacao: object
+
+def _criar_grafico():
+    """Monta a figura uma vez; por requisição só os dados das curvas mudam"""
+    fig = Figure(figsize=(10, 5.7), dpi=200)  # 2000 x 1140 px, já no tamanho final
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    
+    faixa = ax.fill_between([0, 1], [0, 0], [0, 0], alpha=0.2, color='#1E40AF',
+                            label='Faixa de Operacao')
+    pior, = ax.plot([], [], '--', color='#DC2626', linewidth=2, label='Pior Caso')
+    nominal, = ax.plot([], [], color='#1E40AF', linewidth=3, label='Nominal')
+    melhor, = ax.plot([], [], '--', color='#059669', linewidth=2, label='Melhor Caso')
+    operacao, = ax.plot([], [], 'o', markersize=12, color='#D97706',
+                        markeredgecolor='black', markeredgewidth=2)
+    
+    ax.set_title('Curva do Sistema - Variacao de Niveis', fontsize=18, fontweight='bold', pad=20)
+    ax.set_xlabel('Vazao (m³/h)', fontsize=14, fontweight='bold')
+    ax.set_ylabel('Altura Manometrica (m)', fontsize=14, fontweight='bold')
+    ax.grid(True, alpha=0.3)
+    
+    return GraficoSistema(fig, canvas, ax, faixa, pior, nominal, melhor, operacao)
+
+GRAFICO = _criar_grafico()
+# Figure do matplotlib não é reentrante: uma requisição por vez desenha nela
+_GRAFICO_LOCK = threading.Lock()
+
+def render_curva_sistema(q_m3h, h_pior, h_nominal, h_melhor, Q_m3h, Hmt):
+    """
+    Atualiza as curvas da figura compartilhada e rasteriza
+    
+    Returns:
+        PIL.Image: Gráfico em RGB (2000 x 1140 px)
+    """
+    g = GRAFICO
+    with _GRAFICO_LOCK:
+        # Faixa de operação: contorno fechado melhor (ida) + pior (volta)
+        g.faixa.set_verts([np.column_stack((np.concatenate((q_m3h, q_m3h[::-1])),
+                                            np.concatenate((h_melhor, h_pior[::-1]))))])
+        g.pior.set_data(q_m3h, h_pior)
+        g.nominal.set_data(q_m3h, h_nominal)
+        g.melhor.set_data(q_m3h, h_melhor)
+        g.operacao.set_data([Q_m3h], [Hmt])
+        g.operacao.set_label(f'Operacao ({Q_m3h:.1f} m³/h, {Hmt:.1f} m)')
+        g.ax.legend(fontsize=11, loc='upper left')
+        
+        g.ax.relim()
+        g.ax.autoscale()
+        g.ax.set_xlim(left=0)
+        g.ax.set_ylim(bottom=0)
+        
+        g.fig.tight_layout()
+        # Rasteriza no Agg e entrega o buffer RGBA direto ao PIL (sem PNG no meio)
+        g.canvas.draw()
+        return Image.fromarray(np.asarray(g.canvas.buffer_rgba())).convert('RGB')
+
+# ============== RELATÓRIO PDF ==============
+@dataclass(frozen=True)
+class DadosRelatorio:
+    name: str
+    now: str
+    Q: float
+    Hmt: float
+    P_hid_W: float
+    temp: float
+    mu_cp: float
+    warnings: list
+    errors: list
+    recomendacoes: list
+    q_m3h: np.ndarray
+    h_pior: np.ndarray
+    h_nominal: np.ndarray
+    h_melhor: np.ndarray
+
+def _montar_pdf(dados):
+    """
+    Desenha o relatório (gráfico incluso) em uma página e o codifica em PDF
+    
+    Returns:
+        bytes: Conteúdo do PDF
+    """
+    t_pdf = time.perf_counter()
+    graph_img = render_curva_sistema(dados.q_m3h, dados.h_pior, dados.h_nominal, dados.h_melhor,
+                                     dados.Q * 3600, dados.Hmt)
+    
+    # ===== PDF =====
+    # Os desenhos são registrados e só executados depois que y_pos final é
+    # conhecido, para alocar a página na altura exata do conteúdo
+    width = 2480
+    ops = []
+    
+    def draw_text(*args, **kwargs):
+        ops.append(("text", args, kwargs))
+    
+    def draw_rectangle(*args, **kwargs):
+        ops.append(("rectangle", args, kwargs))
+    
+    def paste(image, box):
+        ops.append(("paste", (image, box), {}))
+    
+    # Cabeçalho
+    # Gradiente vertical montado como array e colado de uma vez
+    ratio = np.arange(450) / 450
+    faixa = np.stack([30 + (100-30) * ratio,
+                      64 + (150-64) * ratio,
+                      175 + (220-175) * ratio], axis=-1).astype(np.uint8)
+    paste(Image.fromarray(np.repeat(faixa[:, None, :], width, axis=1)), (0, 0))
+    
+    draw_text((width//2, 150), "RELATORIO DE", fill="#FFFFFF", font=FONTS.title, anchor="mm")
+    draw_text((width//2, 260), "DIMENSIONAMENTO", fill="#FFFFFF", font=FONTS.title, anchor="mm")
+    draw_text((width//2, 350), "Bomba Centrifuga - Analise Completa", fill="#E0E7FF", font=FONTS.subtitle, anchor="mm")
+    
+    y_pos = 520
+    
+    def add_section_header(title):
+        nonlocal y_pos
+        y_pos += 15
+        draw_rectangle([(100, y_pos), (2380, y_pos+90)], fill="#1E40AF")
+        draw_text((140, y_pos+45), title, fill="white", font=FONTS.header, anchor="lm")
+        y_pos += 105
+    
+    def add_alert_box(message, alert_type="warning"):
+        nonlocal y_pos
+        colors = {
+            "warning": ("#FEF3C7", "#F59E0B", "#92400E"),
+            "success": ("#D1FAE5", "#10B981", "#065F46"),
+            "error": ("#FEE2E2", "#EF4444", "#991B1B")
+        }
+        bg, border, text = colors.get(alert_type, colors["warning"])
+        box_height = 90
+        draw_rectangle([(100, y_pos), (2380, y_pos+box_height)], fill=bg, outline=border, width=4)
+        draw_text((140, y_pos+45), message, fill=text, font=FONTS.text, anchor="lm")
+        y_pos += box_height + 15
+    
+    def add_bullet_list(items):
+        nonlocal y_pos
+        for item in items:
+            draw_text((140, y_pos), f"- {item}", fill="#374151", font=FONTS.small, anchor="lm")
+            y_pos += 55
+        y_pos += 20
+    
+    # Conteúdo
+    add_section_header("INFORMACOES")
+    draw_text((140, y_pos), f"Projeto: {dados.name}", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    draw_text((140, y_pos), f"Data: {dados.now}", fill="#374151", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    
+    add_section_header("STATUS")
+    if dados.errors:
+        add_alert_box(f"{len(dados.errors)} ERRO(S) ENCONTRADO(S)", "error")
+    elif dados.warnings:
+        add_alert_box(f"{len(dados.warnings)} ALERTA(S)", "warning")
     else:
-        P_rec = 101325
-    
-    # Calcula perdas no recalque
-    hf_rec_g, hl_rec_g = 0.0, 0.0
-    for t in rec.get("trechos", []):
-        L = float(t.get("L", 0))
-        D = float(t.get("D", 0.1))
-        mat = t.get("material")
-        rug_custom = t.get("rugosidade_mm")
-        conn = int(t.get("conexoes", 0))
-        v_g = velocity(q_val, D)
-        Re_g = reynolds(rho, v_g, D, mu)
-        f_g = friction_factor(Re_g, D, material=mat, rugosidade_mm=rug_custom)
-        hf_rec_g += hf_distributed(L, D, v_g, f_g)
-        hl_rec_g += hf_local(0.5*conn, v_g)
-    
-    # Hmt = diferença de pressão + diferença geométrica + perdas
-    delta_P = (P_rec - P_suc) / (rho * 9.81)
-    delta_h = nivel_rec - nivel_suc
-    perdas = hf_suc_g + hl_suc_g + hf_rec_g + hl_rec_g
-    
-    return delta_P + delta_h + perdas
+        add_alert_box("Sistema OK", "success")
+    
+    add_section_header("RESULTADOS")
+    draw_text((140, y_pos), f"Vazao: {dados.Q*3600:.2f} m³/h", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    draw_text((140, y_pos), f"Hmt: {dados.Hmt:.2f} m", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    draw_text((140, y_pos), f"Potencia: {dados.P_hid_W/1000:.2f} kW", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    draw_text((140, y_pos), f"Temperatura: {dados.temp:.0f} C", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    draw_text((140, y_pos), f"Viscosidade: {dados.mu_cp:.1f} cP", fill="#000000", font=FONTS.small, anchor="lm")
+    y_pos += 55
+    
+    add_section_header("GRAFICO")
+    paste(graph_img, (240, y_pos))
+    y_pos += graph_img.height + 30
+    
+    if dados.warnings:
+        add_section_header("ALERTAS")
+        for warn in dados.warnings:
+            add_alert_box(f"{warn['categoria']}: {warn['mensagem']}", "warning")
+            if 'impacto' in warn:
+                draw_text((160, y_pos), f"Impacto: {warn['impacto']}",
+                          fill="#6B7280", font=FONTS.small, anchor="lm")
+                y_pos += 50
+            add_bullet_list(warn['acao'])
+    
+    if dados.errors:
+        add_section_header("ERROS IMPEDITIVOS")
+        for err in dados.errors:
+            add_alert_box(f"{err['categoria']}: {err['mensagem']}", "error")
+            if 'impacto' in err:
+                draw_text((160, y_pos), f"Impacto: {err['impacto']}",
+                          fill="#6B7280", font=FONTS.small, anchor="lm")
+                y_pos += 50
+            add_bullet_list(err['acao'])
+    
+    add_section_header("RECOMENDACOES")
+    add_bullet_list(dados.recomendacoes)
+    
+    img = Image.new('RGB', (width, y_pos + 100), color='#FFFFFF')
+    draw = ImageDraw.Draw(img)
+    for metodo, args, kwargs in ops:
+        getattr(img if metodo == "paste" else draw, metodo)(*args, **kwargs)
+    
+    # PDF em memória: enviado direto ao Supabase ou gravado em static/
+    pdf_buf = io.BytesIO()
+    img.save(pdf_buf, "PDF", resolution=300.0)
+    pdf_data = pdf_buf.getvalue()
+    
+    print(f"📄 Gráfico + PDF gerados em {(time.perf_counter() - t_pdf)*1000:.0f} ms")
+    return pdf_data
+
+def _url_pdf(case_id, modo_local):
+    """URL final do PDF: static/ no modo local, senão a URL pública do Supabase Storage"""
+    if modo_local:
+        return f"http://localhost:{os.environ.get('PORT', 5000)}/static/{case_id}.pdf"
+    # URL pública é determinística: montada localmente
+    return f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{SUPABASE_BUCKET}/{case_id}/relatorio.pdf"
+
+def _salvar_pdf_local(pdf_data, case_id):
+    """
+    Grava o PDF em static/ de forma atômica
+    
+    Escreve num temporário da mesma pasta e renomeia: quem consulta a URL
+    recebe 404 até o arquivo estar completo, nunca um PDF pela metade.
+    """
+    destino = os.path.join(STATIC_DIR, f"{case_id}.pdf")
+    tmp = f"{destino}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(pdf_data)
+    os.replace(tmp, destino)
+
+def _enviar_supabase(pdf_data, case_id):
+    """Envia o PDF ao Supabase Storage e retorna a URL pública (exceção se falhar)"""
+    print("☁️ Modo PRODUÇÃO: fazendo upload para Supabase...")
+    get_supabase().storage.from_(SUPABASE_BUCKET).upload(
+        path=f"{case_id}/relatorio.pdf",
+        file=pdf_data,
+        file_options={"content-type": "application/pdf"}
+    )
+    pdf_url = _url_pdf(case_id, modo_local=False)
+    print(f"✅ Upload concluído: {pdf_url}")
+    return pdf_url
+
+def _publicar_pdf(pdf_data, case_id, modo_local, avisos):
+    """
+    Grava o PDF em static/ (modo local) ou envia ao Supabase Storage
+    
+    Falha no upload vira aviso em avisos e o PDF cai para static/.
+    
+    Returns:
+        str: URL do PDF
+    """
+    if modo_local:
+        # Modo local: salva PDF na pasta static
+        print("🔧 Modo LOCAL: salvando PDF em static/")
+        _salvar_pdf_local(pdf_data, case_id)
+        return _url_pdf(case_id, modo_local)
+    
+    # Modo produção: upload para Supabase
+    try:
+        return _enviar_supabase(pdf_data, case_id)
+    except Exception as e:
+        print(f"❌ Erro no upload: {e}")
+        avisos.append({
+            "nivel": "ALERTA",
+            "categoria": "Upload",
+            "mensagem": f"Falha no upload do PDF: {str(e)}",
+            "impacto": "Relatório não disponível online",
+            "acao": ["Verificar conexão Supabase", "Configurar variáveis .env"]
+        })
+        # Fallback para modo local
+        _salvar_pdf_local(pdf_data, case_id)
+        return f"/static/{case_id}.pdf"
+
+def _gerar_relatorio(dados, case_id, modo_local, avisos):
+    """Gráfico + PDF + publicação; retorna a URL do PDF"""
+    return _publicar_pdf(_montar_pdf(dados), case_id, modo_local, avisos)
+
+def _gerar_relatorio_em_segundo_plano(dados, case_id, modo_local):
+    """
+    Versão de _gerar_relatorio para o pool, sem fallback local
+    
+    O cliente já recebeu a URL final (_url_pdf): uma cópia em static/ após
+    falha no upload ficaria numa URL que ninguém conhece, então a falha só
+    vai para o log e o relatório é perdido.
+    """
+    pdf_data = _montar_pdf(dados)
+    if modo_local:
+        print("🔧 Modo LOCAL: salvando PDF em static/")
+        _salvar_pdf_local(pdf_data, case_id)
+        return
+    try:
+        _enviar_supabase(pdf_data, case_id)
+    except Exception as e:
+        print(f"❌ Erro no upload: {e}")
+        print(f"⚠️ Relatório {case_id} gerado em segundo plano foi perdido")
+
+# ============== RELATÓRIO EM SEGUNDO PLANO ==============
+# Um único worker: os relatórios saem em ordem e não disputam a figura
+_PDF_POOL = ThreadPoolExecutor(max_workers=1)
+
+def _em_segundo_plano(tarefa, *args):
+    """Executa a tarefa no pool; como ninguém espera o resultado, erros só vão para o log"""
+    try:
+        tarefa(*args)
+    except Exception:
+        import traceback
+        traceback.print_exc()
 
 # ============== FLASK APP ==============
+class OrjsonProvider(JSONProvider):
+    """Provider JSON do Flask com orjson (aceita escalares e arrays NumPy)"""
+    option = orjson.OPT_SERIALIZE_NUMPY
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Usa os bytes do orjson direto, sem decodificar para str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.option),
+                                        mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # jsonify e request.get_json passam a usar orjson
 CORS(app)  # Habilita CORS para todas as rotas
+# Respostas JSON comprimidas (brotli se o cliente aceitar, senão gzip)
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 500
+Compress(app)
 
 # ============== ENDPOINT: LISTAR MATERIAIS ==============
 @app.route("/api/materiais", methods=["GET"])
@@ -368,8 +848,8 @@ def serve_static(filename):
 @app.route("/api/calcular", methods=["POST"])
 def api_calcular():
     try:
-        data = request.get_json()
-        if not data:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not data:
             return jsonify({"status": "error", "message": "JSON inválido"}), 400
         
         # ===== EXTRAÇÃO DE DADOS =====
@@ -422,32 +902,23 @@ def api_calcular():
             })
         
         # Pressão de sucção
-        tipo_res_suc = suc.get("tipo_reservatorio", "aberto")
-        if tipo_res_suc == "pressurizado":
-            P_suc = Patm + float(suc.get("pressao_manometrica", 0))
-        else:
-            P_suc = Patm
+        P_suc = _pressao_reservatorio(suc, Patm)
         
         # Níveis
-        nivel_suc_nom = float(suc.get("nivel_nominal", suc.get("hs", 0)))
-        nivel_suc_min = float(suc.get("nivel_min", nivel_suc_nom))
-        nivel_suc_max = float(suc.get("nivel_max", nivel_suc_nom))
+        nivel_suc_nom, nivel_suc_min, nivel_suc_max = _niveis_reservatorio(suc, "hs")
         
         # Perdas na sucção
-        hf_suc, hl_suc = 0.0, 0.0
-        v_suc_max = 0
-        for t in suc.get("trechos", []):
-            L = float(t.get("L", 0))
-            D = float(t.get("D", 0.1))
-            mat = t.get("material")
-            rug_custom = t.get("rugosidade_mm")
-            conn = int(t.get("conexoes", 0))
-            v = velocity(Q, D)
-            v_suc_max = max(v_suc_max, v)
-            Re = reynolds(rho, v, D, mu)
-            f = friction_factor(Re, D, material=mat, rugosidade_mm=rug_custom)
-            hf_suc += hf_distributed(L, D, v, f)
-            hl_suc += hf_local(0.5*conn, v)
+        # Trechos convertidos em arrays uma vez e reutilizados no ponto de
+        # operação, nos destinos e na curva do sistema
+        try:
+            trechos_suc = _trechos_arrays(suc.get("trechos", []))
+            trechos_rec = [_trechos_arrays(rec.get("trechos", [])) for rec in recalques]
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        hf_suc, hl_suc, v_suc_trechos = _perdas_trechos(Q, *trechos_suc, rho, mu)
+        hf_suc, hl_suc = float(hf_suc), float(hl_suc)
+        v_suc_max = float(v_suc_trechos.max(initial=0.0))
         
         # Validação velocidade sucção
         if v_suc_max < 0.5:
@@ -468,67 +939,54 @@ def api_calcular():
                 "acao": ["Aumentar diametro da tubulacao"]
             })
         
-        # ===== CÁLCULO PARA CADA DESTINO =====
-        resultados_destinos = []
-        Hmt_max = 0
+        # ===== CÁLCULO PARA TODOS OS DESTINOS =====
+        # Perdas, pressões e níveis de todos os destinos em arrays; os três
+        # cenários de Hmt saem de uma expressão cada
+        hf_rec_all, hl_rec_all, v_rec_max_all = _perdas_destinos(trechos_rec, Q, rho, mu)
+        P_rec_all = np.array([_pressao_reservatorio(rec, Patm) for rec in recalques])
+        nivel_rec_nom_all, nivel_rec_min_all, nivel_rec_max_all = np.array(
+            [_niveis_reservatorio(rec, "hr") for rec in recalques]).reshape(-1, 3).T
+        
+        delta_P_all = (P_rec_all - P_suc) / (rho * g)
+        perdas_all = (hf_suc, hl_suc, hf_rec_all, hl_rec_all)
+        Hmt_pior_all = _hmt(delta_P_all, nivel_rec_max_all - nivel_suc_min, *perdas_all)
+        Hmt_nom_all = _hmt(delta_P_all, nivel_rec_nom_all - nivel_suc_nom, *perdas_all)
+        Hmt_melhor_all = _hmt(delta_P_all, nivel_rec_min_all - nivel_suc_max, *perdas_all)
+        Hmt_max = float(Hmt_pior_all.max(initial=0.0))
+        if not math.isfinite(Hmt_max):
+            return jsonify({"status": "error", "message": "Hmt não finito: verifique os dados do fluido e dos trechos"}), 400
+        
+        # NPSHa só depende da sucção: igual para todos os destinos
+        # Velocidade na entrada da bomba: primeiro trecho da sucção, já calculada
+        v_suc = float(v_suc_trechos[0]) if v_suc_trechos.size else velocity(Q, 0.1)
+        NPSHa_val = npsha(Patm, Pvap, rho, g, P_suc, nivel_suc_min, hf_suc, v_suc)
+        cav_ok = bool(float(NPSHa_val) > float(NPSHr_user + 0.5))
         
+        NPSHa_round = round(NPSHa_val, 2)
+        
+        resultados_destinos = []
         for idx, rec in enumerate(recalques):
             destino_id = rec.get("destino_id", f"Destino_{idx+1}")
             
-            nivel_rec_nom = float(rec.get("nivel_nominal", rec.get("hr", 0)))
-            nivel_rec_min = float(rec.get("nivel_min", nivel_rec_nom))
-            nivel_rec_max = float(rec.get("nivel_max", nivel_rec_nom))
-            
-            tipo_res_rec = rec.get("tipo_reservatorio", "aberto")
-            if tipo_res_rec == "pressurizado":
-                P_rec = Patm + float(rec.get("pressao_manometrica", 0))
-            else:
-                P_rec = Patm
-            
-            hf_rec, hl_rec = 0.0, 0.0
-            v_rec_max = 0
-            for t in rec.get("trechos", []):
-                L = float(t.get("L", 0))
-                D = float(t.get("D", 0.1))
-                mat = t.get("material")
-                rug_custom = t.get("rugosidade_mm")
-                conn = int(t.get("conexoes", 0))
-                v = velocity(Q, D)
-                v_rec_max = max(v_rec_max, v)
-                Re = reynolds(rho, v, D, mu)
-                f = friction_factor(Re, D, material=mat, rugosidade_mm=rug_custom)
-                hf_rec += hf_distributed(L, D, v, f)
-                hl_rec += hf_local(0.5*conn, v)
-            
-            if v_rec_max > 5.0:
+            if v_rec_max_all[idx] > 5.0:
                 warnings.append({
                     "nivel": "ALERTA",
                     "categoria": "Velocidade",
-                    "mensagem": f"Velocidade recalque {destino_id} ALTA: {v_rec_max:.2f} m/s",
+                    "mensagem": f"Velocidade recalque {destino_id} ALTA: {v_rec_max_all[idx]:.2f} m/s",
                     "impacto": "Risco de erosao",
                     "acao": ["Aumentar diametro"]
                 })
             
-            Hmt_pior = calculate_hmt_for_scenario(Q, data, fluido, nivel_suc_min, nivel_rec_max, idx)
-            Hmt_nom = calculate_hmt_for_scenario(Q, data, fluido, nivel_suc_nom, nivel_rec_nom, idx)
-            Hmt_melhor = calculate_hmt_for_scenario(Q, data, fluido, nivel_suc_max, nivel_rec_min, idx)
-            
-            Hmt_max = max(Hmt_max, Hmt_pior)
-            
-            D_suc = float(suc.get("trechos", [{}])[0].get("D", 0.1))
-            v_suc = velocity(Q, D_suc)
-            NPSHa_val = npsha(Patm, Pvap, rho, g, P_suc, nivel_suc_min, hf_suc, v_suc)
-            cav_ok = bool(float(NPSHa_val) > float(NPSHr_user + 0.5))
-            
+            # float() antes de round(): round() de np.float64 usa o arredondamento do NumPy
             resultados_destinos.append({
                 "destino_id": destino_id,
-                "Hmt_pior": float(round(Hmt_pior, 2)),
-                "Hmt_nominal": float(round(Hmt_nom, 2)),
-                "Hmt_melhor": float(round(Hmt_melhor, 2)),
-                "hf_rec": float(round(hf_rec, 4)),
-                "hl_rec": float(round(hl_rec, 4)),
-                "v_rec_max": float(round(v_rec_max, 2)),
-                "NPSHa": float(round(NPSHa_val, 2)),
+                "Hmt_pior": round(float(Hmt_pior_all[idx]), 2),
+                "Hmt_nominal": round(float(Hmt_nom_all[idx]), 2),
+                "Hmt_melhor": round(float(Hmt_melhor_all[idx]), 2),
+                "hf_rec": round(float(hf_rec_all[idx]), 4),
+                "hl_rec": round(float(hl_rec_all[idx]), 4),
+                "v_rec_max": round(float(v_rec_max_all[idx]), 2),
+                "NPSHa": NPSHa_round,
                 "cavitation_ok": cav_ok
             })
         
@@ -578,238 +1036,65 @@ def api_calcular():
         recomendacoes.append("Verificar curva do fabricante")
         recomendacoes.append(f"NPSHr da bomba <= {min(r['NPSHa'] for r in resultados_destinos)-0.5:.2f} m")
         
-        case_id = str(uuid.uuid4())
-        now = datetime.now().strftime("%d/%m/%Y %H:%M")
-        
-        # ===== GRÁFICO =====
-        graph_path = os.path.join(UPLOAD_DIR, f"{case_id}_graph.png")
-        
-        q_range_m3h = np.linspace(0, Q * 3600 * 1.5, 100)
-        q_range_m3s = q_range_m3h / 3600
-        
-        h_pior = [calculate_hmt_for_scenario(q, data, fluido, nivel_suc_min,
-                   recalques[0].get("nivel_max", recalques[0].get("nivel_nominal", recalques[0].get("hr", 0)))) for q in q_range_m3s]
-        h_nominal = [calculate_hmt_for_scenario(q, data, fluido, nivel_suc_nom,
-                      recalques[0].get("nivel_nominal", recalques[0].get("hr", 0))) for q in q_range_m3s]
-        h_melhor = [calculate_hmt_for_scenario(q, data, fluido, nivel_suc_max,
-                     recalques[0].get("nivel_min", recalques[0].get("nivel_nominal", recalques[0].get("hr", 0)))) for q in q_range_m3s]
-        
-        plt.style.use('seaborn-v0_8-whitegrid')
-        fig, ax = plt.subplots(figsize=(14, 8))
-        
-        ax.fill_between(q_range_m3h, h_melhor, h_pior, alpha=0.2, color='#1E40AF',
-                        label='Faixa de Operacao')
-        
-        ax.plot(q_range_m3h, h_pior, '--', color='#DC2626', linewidth=2, label='Pior Caso')
-        ax.plot(q_range_m3h, h_nominal, color='#1E40AF', linewidth=3, label='Nominal')
-        ax.plot(q_range_m3h, h_melhor, '--', color='#059669', linewidth=2, label='Melhor Caso')
-        
-        ax.plot(Q * 3600, Hmt, 'o', markersize=12, color='#D97706',
-                markeredgecolor='black', markeredgewidth=2,
-                label=f'Operacao ({Q*3600:.1f} m³/h, {Hmt:.1f} m)')
-        
-        ax.set_title('Curva do Sistema - Variacao de Niveis', fontsize=18, fontweight='bold', pad=20)
-        ax.set_xlabel('Vazao (m³/h)', fontsize=14, fontweight='bold')
-        ax.set_ylabel('Altura Manometrica (m)', fontsize=14, fontweight='bold')
-        ax.legend(fontsize=11, loc='upper left')
-        ax.grid(True, alpha=0.3)
-        ax.set_xlim(left=0)
-        ax.set_ylim(bottom=0)
-        
-        fig.tight_layout()
-        plt.savefig(graph_path, dpi=200, bbox_inches='tight')
-        plt.close(fig)
-        
-        # ===== PDF =====
-        pdf_path = os.path.join(UPLOAD_DIR, f"{case_id}.pdf")
-        width = 2480
-        height = 9000
-        img = Image.new('RGB', (width, height), color='#FFFFFF')
-        draw = ImageDraw.Draw(img)
-        
-        # ✅ FONTES COM FALLBACK PARA LINUX
-        try:
-            font_title = ImageFont.truetype("arialbd.ttf", 140)
-            font_subtitle = ImageFont.truetype("arial.ttf", 65)
-            font_header = ImageFont.truetype("arialbd.ttf", 70)
-            font_text = ImageFont.truetype("arial.ttf", 52)
-            font_small = ImageFont.truetype("arial.ttf", 46)
-        except:
-            try:
-                font_title = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 140)
-                font_subtitle = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 65)
-                font_header = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", 70)
-                font_text = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 52)
-                font_small = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", 46)
-            except:
-                font_title = font_subtitle = font_header = font_text = font_small = ImageFont.load_default()
-        
-        # Cabeçalho
-        for y in range(0, 450):
-            ratio = y / 450
-            r = int(30 + (100-30) * ratio)
-            g = int(64 + (150-64) * ratio)
-            b = int(175 + (220-175) * ratio)
-            draw.line([(0, y), (width, y)], fill=(r, g, b))
-        
-        draw.text((width//2, 150), "RELATORIO DE", fill="#FFFFFF", font=font_title, anchor="mm")
-        draw.text((width//2, 260), "DIMENSIONAMENTO", fill="#FFFFFF", font=font_title, anchor="mm")
-        draw.text((width//2, 350), "Bomba Centrifuga - Analise Completa", fill="#E0E7FF", font=font_subtitle, anchor="mm")
-        
-        y_pos = 520
-        
-        def add_section_header(title):
-            nonlocal y_pos
-            y_pos += 15
-            draw.rectangle([(100, y_pos), (2380, y_pos+90)], fill="#1E40AF")
-            draw.text((140, y_pos+45), title, fill="white", font=font_header, anchor="lm")
-            y_pos += 105
-        
-        def add_alert_box(message, alert_type="warning"):
-            nonlocal y_pos
-            colors = {
-                "warning": ("#FEF3C7", "#F59E0B", "#92400E"),
-                "success": ("#D1FAE5", "#10B981", "#065F46"),
-                "error": ("#FEE2E2", "#EF4444", "#991B1B")
-            }
-            bg, border, text = colors.get(alert_type, colors["warning"])
-            box_height = 90
-            draw.rectangle([(100, y_pos), (2380, y_pos+box_height)], fill=bg, outline=border, width=4)
-            draw.text((140, y_pos+45), message, fill=text, font=font_text, anchor="lm")
-            y_pos += box_height + 15
-        
-        def add_bullet_list(items):
-            nonlocal y_pos
-            for item in items:
-                draw.text((140, y_pos), f"- {item}", fill="#374151", font=font_small, anchor="lm")
-                y_pos += 55
-            y_pos += 20
-        
-        # Conteúdo
-        add_section_header("INFORMACOES")
-        draw.text((140, y_pos), f"Projeto: {name}", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        draw.text((140, y_pos), f"Data: {now}", fill="#374151", font=font_small, anchor="lm")
-        y_pos += 55
-        
-        add_section_header("STATUS")
-        if errors:
-            add_alert_box(f"{len(errors)} ERRO(S) ENCONTRADO(S)", "error")
-        elif warnings:
-            add_alert_box(f"{len(warnings)} ALERTA(S)", "warning")
-        else:
-            add_alert_box("Sistema OK", "success")
-        
-        add_section_header("RESULTADOS")
-        draw.text((140, y_pos), f"Vazao: {Q*3600:.2f} m³/h", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        draw.text((140, y_pos), f"Hmt: {Hmt:.2f} m", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        draw.text((140, y_pos), f"Potencia: {P_hid_W/1000:.2f} kW", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        draw.text((140, y_pos), f"Temperatura: {temp:.0f} C", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        draw.text((140, y_pos), f"Viscosidade: {mu_cp:.1f} cP", fill="#000000", font=font_small, anchor="lm")
-        y_pos += 55
-        
-        add_section_header("GRAFICO")
-        try:
-            with Image.open(graph_path) as graph_img:
-                new_width = 2000
-                new_height = int(2000 * graph_img.height / graph_img.width)
-                graph_img = graph_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                img.paste(graph_img, (240, y_pos))
-                y_pos += new_height + 30
-        except:
-            pass
-        
-        if warnings:
-            add_section_header("ALERTAS")
-            for warn in warnings:
-                add_alert_box(f"{warn['categoria']}: {warn['mensagem']}", "warning")
-                if 'impacto' in warn:
-                    draw.text((160, y_pos), f"Impacto: {warn['impacto']}",
-                             fill="#6B7280", font=font_small, anchor="lm")
-                    y_pos += 50
-                add_bullet_list(warn['acao'])
-        
-        if errors:
-            add_section_header("ERROS IMPEDITIVOS")
-            for err in errors:
-                add_alert_box(f"{err['categoria']}: {err['mensagem']}", "error")
-                if 'impacto' in err:
-                    draw.text((160, y_pos), f"Impacto: {err['impacto']}",
-                             fill="#6B7280", font=font_small, anchor="lm")
-                    y_pos += 50
-                add_bullet_list(err['acao'])
-        
-        add_section_header("RECOMENDACOES")
-        add_bullet_list(recomendacoes)
-        
-        img.save(pdf_path, "PDF", resolution=300.0)
-        
-        # ===== UPLOAD OU MODO LOCAL =====
-        pdf_url = None
-        modo_local = os.getenv("TEST_MODE_LOCAL", "false").lower() == "true" or supabase_client is None
-        
-        if modo_local:
-            # Modo local: copia PDF para pasta static
-            print("🔧 Modo LOCAL: salvando PDF em static/")
-            static_pdf_path = os.path.join(STATIC_DIR, f"{case_id}.pdf")
-            shutil.copy2(pdf_path, static_pdf_path)
-            pdf_url = f"http://localhost:{os.environ.get('PORT', 5000)}/static/{case_id}.pdf"
-        else:
-            # Modo produção: upload para Supabase
-            try:
-                print("☁️ Modo PRODUÇÃO: fazendo upload para Supabase...")
-                with open(pdf_path, "rb") as f:
-                    file_data = f.read()
-                remote_path = f"{case_id}/relatorio.pdf"
-                supabase_client.storage.from_(SUPABASE_BUCKET).upload(
-                    path=remote_path,
-                    file=file_data,
-                    file_options={"content-type": "application/pdf"}
-                )
-                pdf_url = supabase_client.storage.from_(SUPABASE_BUCKET).get_public_url(remote_path)
-                print(f"✅ Upload concluído: {pdf_url}")
-            except Exception as e:
-                print(f"❌ Erro no upload: {e}")
-                warnings.append({
-                    "nivel": "ALERTA",
-                    "categoria": "Upload",
-                    "mensagem": f"Falha no upload do PDF: {str(e)}",
-                    "impacto": "Relatório não disponível online",
-                    "acao": ["Verificar conexão Supabase", "Configurar variáveis .env"]
-                })
-                # Fallback para modo local
-                static_pdf_path = os.path.join(STATIC_DIR, f"{case_id}.pdf")
-                shutil.copy2(pdf_path, static_pdf_path)
-                pdf_url = f"/static/{case_id}.pdf"
+        case_id = secrets.token_hex(16)
+        now = time.strftime("%d/%m/%Y %H:%M")
+        modo_local = os.getenv("TEST_MODE_LOCAL", "false").lower() == "true" or get_supabase() is None
         
-        # Cleanup (remove arquivos temporários)
-        try:
-            if not os.getenv("KEEP_FILES", "false").lower() == "true":
-                os.remove(pdf_path)
-                os.remove(graph_path)
-        except Exception as e:
-            print(f"⚠️ Aviso: não foi possível remover arquivos temporários: {e}")
-        
-        return jsonify({
+        resposta = {
             "status": "ok" if not errors else "warning",
             "case_id": case_id,
-            "pdf_url": str(pdf_url),
+            "pdf_url": None,
             "modo_local": modo_local,
             "temperatura": temp,
             "viscosidade_cp": mu_cp,
-            "H_mt_nominal": float(round(Hmt, 2)),
-            "pressao_bar": float(round(P_bar, 2)),
-            "P_hid_kW": float(round(P_hid_W/1000, 2)),
-            "velocidade_succao": float(round(v_suc_max, 2)),
+            "H_mt_nominal": round(Hmt, 2),
+            "pressao_bar": round(P_bar, 2),
+            "P_hid_kW": round(P_hid_W/1000, 2),
+            "velocidade_succao": round(v_suc_max, 2),
             "resultados_destinos": resultados_destinos,
             "warnings": warnings,
             "errors": errors,
             "recomendacoes": recomendacoes
-        })
+        }
+        
+        # Cliente só quer os números: sem gráfico, PDF nem upload
+        if data.get("skip_pdf"):
+            return jsonify(resposta)
+        
+        # ===== CURVA DO SISTEMA (GRÁFICO DO RELATÓRIO) =====
+        q_range_m3h = np.linspace(0, Q * 3600 * 1.5, 100)
+        q_range_m3s = q_range_m3h / 3600
+        
+        rec0 = recalques[0]
+        nivel_rec0_nom, nivel_rec0_min, nivel_rec0_max = _niveis_reservatorio(rec0, "hr")
+        P_rec0 = _pressao_reservatorio(rec0, Patm)
+        
+        # Sucção e recalque em série: mesma vazão, perdas somadas no kernel
+        trechos_curva = [np.concatenate(par) for par in zip(trechos_suc, trechos_rec[0])]
+        delta_P0 = (P_rec0 - P_suc) / (rho * g)
+        h_sistema = np.empty(q_range_m3s.size)
+        system_curve(q_range_m3s, *trechos_curva, rho, mu, delta_P0, h_sistema)
+        
+        sem_vazao = q_range_m3s <= 0
+        h_pior = np.where(sem_vazao, 0, h_sistema + nivel_rec0_max - nivel_suc_min)
+        h_nominal = np.where(sem_vazao, 0, h_sistema + nivel_rec0_nom - nivel_suc_nom)
+        h_melhor = np.where(sem_vazao, 0, h_sistema + nivel_rec0_min - nivel_suc_max)
+        
+        dados = DadosRelatorio(
+            name=name, now=now, Q=Q, Hmt=Hmt, P_hid_W=P_hid_W, temp=temp, mu_cp=mu_cp,
+            warnings=warnings, errors=errors, recomendacoes=recomendacoes,
+            q_m3h=q_range_m3h, h_pior=h_pior, h_nominal=h_nominal, h_melhor=h_melhor,
+        )
+        
+        # Relatório em segundo plano: responde já com a URL onde o PDF vai
+        # aparecer (404 até o upload/gravação terminar)
+        if data.get("pdf_async"):
+            _PDF_POOL.submit(_em_segundo_plano, _gerar_relatorio_em_segundo_plano, dados, case_id, modo_local)
+            resposta["pdf_url"] = _url_pdf(case_id, modo_local)
+            return jsonify(resposta)
+        
+        resposta["pdf_url"] = str(_gerar_relatorio(dados, case_id, modo_local, warnings))
+        return jsonify(resposta)
     
     except Exception as e:
         import traceback
@@ -822,7 +1107,7 @@ if __name__ == "__main__":
     print("=" * 60)
     print("🚀 SERVIDOR FLASK INICIADO")
     print("=" * 60)
-    if supabase_client:
+    if get_supabase():
         print("☁️  Modo: PRODUÇÃO (Supabase conectado)")
     else:
         print("🔧 Modo: LOCAL (sem Supabase)")